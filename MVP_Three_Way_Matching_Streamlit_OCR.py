@@ -1,108 +1,682 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pdfplumber
-import pytesseract
-from pdf2image import convert_from_bytes
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+import gzip
 import io
-import re
-import dateparser
-from datetime import timedelta
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+import threading
+import unicodedata
+
+try:
+    # BLAKE3 memakai SIMD (AVX2/AVX-512) dan jauh lebih cepat dari SHA-256 untuk file besar;
+    # hash hanya dipakai sebagai identitas file untuk cache, bukan keperluan kriptografi
+    from blake3 import blake3 as _file_hasher
+except ImportError:
+    from hashlib import sha256 as _file_hasher
+
+try:
+    # google-re2: berbasis DFA, waktu scan linear walau teks OCR berantakan
+    import re2 as re
+except ImportError:
+    import re
 
 # ============== HELPER FUNCTIONS =================
 
-def read_pdf_fast(file_bytes, ocr_lang="ind"):
-    """Coba baca PDF cepat dengan pdfplumber, jika kosong baru OCR halaman pertama."""
-    text = ""
+# Waktu Tesseract naik kira-kira sebanding jumlah piksel; 200 DPI cukup untuk scan yang terbaca
+OCR_DPI = 200
+# Pass cepat kontrak; naik ke OCR_DPI hanya jika field utama tidak ketemu
+OCR_QUICK_DPI = 150
+# Sisi terpanjang gambar yang dikirim ke OCR pada OCR_DPI (~137 DPI untuk A4), cukup untuk
+# teks dokumen biasa; DPI lain diskalakan sebanding (lihat _max_side)
+OCR_MAX_SIDE = 1600
+# Halaman tanpa teks yang isinya hanya gambar dengan cakupan kurang dari ini (cover kosong,
+# sisi belakang halaman, logo/stempel saja) tidak di-OCR
+MIN_CAKUPAN_GAMBAR = 0.05
+# Jumlah halaman yang di-OCR bersamaan (seluruh proses); bisa diatur lewat env OCR_WORKERS
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", min(4, os.cpu_count() or 1)))
+# Teks hasil OCR disimpan di disk (gzip) supaya upload ulang setelah app restart tidak
+# di-OCR lagi; total ukurannya dibatasi, file yang paling lama tidak dipakai dihapus dulu
+OCR_CACHE_DIR = os.environ.get(
+    "OCR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "three-way-matching")
+)
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Naikkan jika pipeline OCR berubah supaya teks lama di disk tidak terpakai lagi
+OCR_CACHE_VERSI = 1
+# Rata-rata confidence Tesseract (0-100) di bawah ini dianggap gagal dan halaman
+# diulang dengan EasyOCR (lebih akurat untuk scan jelek, tapi jauh lebih lambat)
+OCR_MIN_CONF = 60
+
+log = logging.getLogger(__name__)
+
+# Library OCR (pytesseract, pdf2image, OpenCV, tesserocr) berat untuk di-import;
+# semuanya di-import di dalam fungsi supaya UI tampil dulu dan PDF ber-text layer
+# tidak pernah memuatnya sama sekali.
+
+@lru_cache(maxsize=1)
+def _tesserocr():
+    """Import tesserocr sekali; None jika tidak terpasang (fallback ke pytesseract)."""
+    try:
+        import tesserocr
+    except ImportError:
+        return None
+    return tesserocr
+
+@st.cache_resource
+def _tess_local():
+    """Penyimpanan per thread untuk PyTessBaseAPI, dibuat sekali per proses: objek
+    level-modul di script Streamlit ikut dibuat ulang setiap rerun."""
+    return threading.local()
+
+def _tess_api(tesserocr, ocr_lang):
+    """PyTessBaseAPI tidak thread-safe, jadi tiap thread worker punya instance sendiri."""
+    local = _tess_local()
+    apis = getattr(local, "apis", None)
+    if apis is None:
+        apis = local.apis = {}
+    if ocr_lang not in apis:
+        apis[ocr_lang] = tesserocr.PyTessBaseAPI(
+            lang=ocr_lang, psm=tesserocr.PSM.SINGLE_BLOCK, oem=tesserocr.OEM.LSTM_ONLY
+        )
+    return apis[ocr_lang]
+
+@st.cache_resource
+def _easyocr_lock():
+    return threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _easyocr_reader():
+    """Reader EasyOCR memuat model detektor + recognizer dari disk, jadi dibuat sekali
+    per proses; None jika EasyOCR tidak terpasang atau gagal dimuat (hasil Tesseract
+    tetap dipakai)."""
+    try:
+        import easyocr
+        import torch
+    except ImportError:
+        return None
+    try:
+        return easyocr.Reader(["id", "en"], gpu=torch.cuda.is_available())
+    except Exception:
+        # Mis. unduhan model diblokir atau memori tidak cukup; jangan gagalkan dokumennya
+        log.exception("EasyOCR gagal dimuat; fallback EasyOCR dinonaktifkan")
+        return None
+
+# Tabel point() untuk binarisasi ambang tetap bila OpenCV tidak tersedia
+_BINER_LUT = [0] * 150 + [255] * 106
+
+def _preprocess(image):
+    """Grayscale + CLAHE + binarisasi Otsu + deskew di OpenCV sebelum gambar masuk Tesseract."""
+    try:
+        import cv2
+    except ImportError:
+        # Tanpa OpenCV: cukup grayscale + ambang tetap lewat point() (satu pass di C)
+        return image.convert("L").point(_BINER_LUT)
+    import numpy as np
+    from PIL import Image
+
+    gray = np.asarray(image.convert("L"))
+    # CLAHE meratakan kontras lokal (scan pudar/bayangan) sebelum threshold global Otsu
+    gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Sudut kemiringan dari kotak minimum yang memuat semua piksel teks (hitam)
+    coords = cv2.findNonZero(255 - bw)
+    if coords is not None:
+        angle = cv2.minAreaRect(coords)[-1]
+        if angle > 45:
+            angle -= 90
+        elif angle < -45:
+            angle += 90
+        if abs(angle) >= 0.5:
+            h, w = bw.shape
+            m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+            bw = cv2.warpAffine(bw, m, (w, h), flags=cv2.INTER_NEAREST, borderValue=255)
+
+    return Image.fromarray(bw)
+
+def _ocr_tesseract(image, ocr_lang):
+    """OCR dengan Tesseract; mengembalikan (teks, rata-rata confidence 0-100)."""
+    # tesserocr memanggil libtesseract langsung (model bahasa dimuat sekali),
+    # pytesseract menjalankan proses tesseract baru untuk tiap gambar
+    tesserocr = _tesserocr()
+    if tesserocr is not None:
+        api = _tess_api(tesserocr, ocr_lang)
+        api.SetImage(image)
+        return api.GetUTF8Text(), api.MeanTextConf()
+
+    import pytesseract
+
+    # image_to_data memberi teks dan confidence per kata dalam satu panggilan tesseract
+    data = pytesseract.image_to_data(
+        image, lang=ocr_lang, config="--psm 6 --oem 1", output_type=pytesseract.Output.DICT
+    )
+    baris, conf = {}, []
+    for i, kata in enumerate(data["text"]):
+        c = float(data["conf"][i])
+        if c < 0 or not kata.strip():  # -1: elemen blok/baris, bukan kata
+            continue
+        conf.append(c)
+        baris.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(kata)
+    text = "\n".join(" ".join(isi) for isi in baris.values())
+    return text, sum(conf) / len(conf) if conf else 0.0
+
+def _max_side(dpi):
+    # Batas ikut DPI supaya pass cepat (OCR_QUICK_DPI) benar-benar lebih kecil daripada
+    # pass ulang di OCR_DPI; batas tetap membuat keduanya menghasilkan gambar yang sama
+    return int(OCR_MAX_SIDE * dpi / OCR_DPI)
+
+def ocr_image(image, ocr_lang="ind", max_side=OCR_MAX_SIDE):
+    import numpy as np
+    from PIL import Image
+
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    prep = _preprocess(image)
+    text, conf = _ocr_tesseract(prep, ocr_lang)
+    prep.close()
+
+    # Halaman bersih tetap di jalur Tesseract; EasyOCR hanya untuk halaman yang
+    # hasilnya kosong atau confidence-nya rendah
+    if len(text.strip()) < 20 or conf < OCR_MIN_CONF:
+        reader = _easyocr_reader()
+        if reader is not None:
+            try:
+                with _easyocr_lock():
+                    hasil = reader.readtext(np.asarray(image.convert("RGB")), detail=0, paragraph=True)
+            except Exception:
+                log.exception("EasyOCR gagal; hasil Tesseract dipakai")
+                hasil = []
+            easy_text = "\n".join(hasil)
+            # Sama seperti di read_pdf_fast: hanya ganti jika hasilnya lebih baik
+            if _jumlah_alnum(easy_text) > _jumlah_alnum(text):
+                text = easy_text
+    return text
+
+@st.cache_resource
+def _ocr_executor():
+    """Pool thread OCR hidup selama proses, jadi PyTessBaseAPI per thread (model
+    bahasa sudah dimuat) dipakai ulang untuk semua halaman dan semua upload."""
+    return ThreadPoolExecutor(max_workers=max(1, OCR_WORKERS), thread_name_prefix="ocr")
+
+def _jumlah_alnum(txt):
+    """Ukuran kasar mutu teks: jumlah huruf/digit (spasi dan sampah tanda baca tidak dihitung)."""
+    return sum(c.isalnum() for c in txt)
+
+# Karakter kontrol (NUL, form feed dari Tesseract, C1) jadi spasi; newline dipertahankan
+_CTRL_TABLE = {c: " " for c in [*range(0x20), *range(0x7F, 0xA0)] if c != 0x0A}
+
+def clean_text(txt):
+    """Buang karakter kontrol lalu rapatkan spasi berlebih per baris (tanpa regex)."""
+    if not txt:
+        return ""
+    return "\n".join(" ".join(line.split()) for line in txt.translate(_CTRL_TABLE).split("\n"))
+
+@st.cache_resource
+def _pdfium_lock():
+    """PDFium tidak thread-safe (termasuk antar dokumen), sedangkan render berjalan di
+    pool OCR dan tiap sesi Streamlit punya thread sendiri; semua akses lewat lock ini."""
+    return threading.Lock()
+
+def _render_pdf_page(file_bytes, page_no, dpi=OCR_DPI):
+    """Render satu halaman langsung di proses lewat PDFium; None jika PDFium gagal."""
+    with _pdfium_lock():
+        try:
+            pdf = pdfium.PdfDocument(file_bytes)
+        except pdfium.PdfiumError:
+            return None
+        try:
+            if page_no > len(pdf):
+                return None
+            page = pdf[page_no - 1]
+            # Render langsung 8-bit grayscale: sepertiga data RGB, dan Tesseract/OpenCV
+            # memang bekerja di grayscale
+            # Batasi skala render supaya tidak render besar lalu diperkecil lagi
+            scale = min(dpi / 72, _max_side(dpi) / max(page.get_size()))
+            bitmap = page.render(scale=scale, grayscale=True)
+            # to_pil() memakai buffer milik PDFium; salin sebelum bitmap/dokumen ditutup
+            image = bitmap.to_pil().copy()
+            bitmap.close()
+            page.close()
+            return image
+        finally:
+            pdf.close()
+
+def _ocr_pdf_page(file_bytes, page_no, ocr_lang="ind", dpi=OCR_DPI):
+    image = _render_pdf_page(file_bytes, page_no, dpi)
+    if image is None:
+        # Cadangan: poppler lewat subprocess (pdftocairo lebih cepat daripada pdftoppm)
+        from pdf2image import convert_from_bytes
+
+        images = convert_from_bytes(
+            file_bytes, dpi=dpi, first_page=page_no, last_page=page_no,
+            use_pdftocairo=True, grayscale=True,
+        )
+        image = images[0] if images else None
+    if image is None:
+        return ""
+    try:
+        return ocr_image(image, ocr_lang, _max_side(dpi))
+    finally:
+        image.close()  # bitmap halaman bisa puluhan MB; jangan tunggu GC
+
+def _cakupan_gambar(kotak, lebar, tinggi):
+    """Perkiraan fraksi luas halaman yang tertutup gambar (tumpang tindih tidak dikurangi)."""
+    luas = 0.0
+    for x0, y0, x1, y1 in kotak:
+        w = min(x1, lebar) - max(x0, 0)
+        h = min(y1, tinggi) - max(y0, 0)
+        if w > 0 and h > 0:
+            luas += w * h
+    return luas / (lebar * tinggi) if lebar > 0 and tinggi > 0 else 0.0
+
+def _pdfium_halaman_kosong(page):
+    """Halaman kosong = tidak ada objek selain gambar, dan gambarnya hanya menutup sedikit.
+    Objek path (font outline, invoice hasil print-to-PDF) atau teks tanpa unicode
+    membuat halaman tetap di-OCR."""
+    kotak = []
+    for obj in page.get_objects():
+        if obj.type != pdfium_c.FPDF_PAGEOBJ_IMAGE:
+            return False
+        # pypdfium2 5.x mengganti nama get_pos() menjadi get_bounds()
+        kotak.append((getattr(obj, "get_bounds", None) or obj.get_pos)())
+    return _cakupan_gambar(kotak, *page.get_size()) < MIN_CAKUPAN_GAMBAR
+
+def _pdfium_page_texts(file_bytes, max_pages):
+    """Text layer per halaman lewat PDFium (C++), jauh lebih cepat daripada pdfplumber."""
+    with _pdfium_lock():
+        pdf = pdfium.PdfDocument(file_bytes)
+        try:
+            page_texts, kosong = [], set()
+            for i in range(min(len(pdf), max_pages)):  # default hanya halaman 1 dulu
+                page = pdf[i]
+                textpage = page.get_textpage()
+                page_texts.append(textpage.get_text_range())
+                textpage.close()
+                if not page_texts[-1].strip() and _pdfium_halaman_kosong(page):
+                    kosong.add(i)
+                page.close()
+            return page_texts, frozenset(kosong)
+        finally:
+            pdf.close()
+
+def _pdfplumber_page_texts(file_bytes, max_pages):
+    """Cadangan untuk PDF yang ditolak PDFium; parser pdfminer lebih toleran."""
+    # pages= membuat pdfplumber hanya memuat halaman yang dibutuhkan
+    with pdfplumber.open(io.BytesIO(file_bytes), pages=list(range(1, max_pages + 1))) as pdf:
+        page_texts, kosong = [], set()
+        for i, page in enumerate(pdf.pages):
+            # Cukup urutan baris sederhana untuk pola "Label: nilai"; jauh lebih
+            # murah daripada extract_text() yang menyusun ulang layout halaman
+            page_texts.append(page.extract_text_simple() or "")
+            # Sama seperti _pdfium_halaman_kosong: hanya halaman yang isinya gambar saja
+            if not page_texts[-1].strip() and set(page.objects) <= {"image"}:
+                # pdfplumber memakai koordinat top/bottom dari atas halaman
+                kotak = [(im["x0"], im["top"], im["x1"], im["bottom"]) for im in page.images]
+                if _cakupan_gambar(kotak, page.width, page.height) < MIN_CAKUPAN_GAMBAR:
+                    kosong.add(i)
+            page.close()  # buang cache objek/karakter halaman
+        return page_texts, frozenset(kosong)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def pdf_page_texts(file_hash, _pdf_file, max_pages=1):
+    """Text layer per halaman, di-cache terpisah dari hasil OCR supaya pass OCR ulang
+    (mis. DPI lebih tinggi) tidak membaca ulang PDF-nya.
+
+    Mengembalikan (page_texts, kosong): kosong berisi indeks halaman tanpa teks
+    maupun gambar berarti, yang tidak perlu di-OCR."""
+    file_bytes = _pdf_file.getvalue()
     try:
-        with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-            for page in pdf.pages[:1]:  # hanya halaman 1 dulu
-                txt = page.extract_text() or ""
-                text += txt
+        return _pdfium_page_texts(file_bytes, max_pages)
     except Exception:
-        text = ""
-    
-    if not text.strip():  # jika kosong, pakai OCR
-        images = convert_from_bytes(file_bytes, first_page=1, last_page=1)
-        text = pytesseract.image_to_string(images[0], lang=ocr_lang)
-    
+        try:
+            return _pdfplumber_page_texts(file_bytes, max_pages)
+        except Exception:
+            return [""] * max_pages, frozenset()
+
+def _text_layer_layak(txt):
+    """Text layer dipakai apa adanya kecuali kosong atau sebagian besar berupa karakter
+    rusak (font tanpa ToUnicode: U+FFFD, private use, kontrol). Teks pendek dan penuh
+    angka/tanda baca (nomor, tanggal, nominal) tetap dianggap teks asli."""
+    txt = "".join(txt.split())
+    if not txt or not _jumlah_alnum(txt):
+        return False
+    rusak = sum(c == "\ufffd" or unicodedata.category(c) in ("Co", "Cn", "Cc", "Cs") for c in txt)
+    return rusak / len(txt) < 0.3
+
+def halaman_perlu_ocr(page_texts, kosong=frozenset()):
+    # Halaman hasil scan tidak punya text layer; PDF campuran cukup OCR halaman itu saja.
+    # Halaman kosong dilewati: OCR-nya mahal dan hanya menghasilkan sampah.
+    return [i for i, t in enumerate(page_texts) if i not in kosong and not _text_layer_layak(t)]
+
+def hash_upload(uploaded_file):
+    # Hash disimpan per upload (file_id unik per unggahan) di session_state, jadi rerun
+    # karena widget lain tidak meng-hash ulang file yang sama
+    hashes = st.session_state.setdefault("_file_hash", {})
+    if uploaded_file.file_id not in hashes:
+        # getbuffer() memberi view langsung ke buffer upload, jadi hashing tidak menyalin isi file
+        with uploaded_file.getbuffer() as buf:
+            hashes[uploaded_file.file_id] = _file_hasher(buf).hexdigest()
+    return hashes[uploaded_file.file_id]
+
+def _disk_cache_path(key):
+    return os.path.join(OCR_CACHE_DIR, f"{key}.txt.gz")
+
+def _disk_cache_get(key):
+    path = _disk_cache_path(key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            text = f.read()
+        os.utime(path)  # mtime = terakhir dipakai, dasar urutan LRU
+    except (OSError, EOFError):
+        return None
     return text
 
-def extract_nomor_kontrak(text):
-    match = re.search(r"(?:Nomor|No)\s*[:\-]?\s*([A-Za-z0-9\/\.\-]+)", text, re.IGNORECASE)
-    return match.group(1) if match else None
+def _disk_cache_prune():
+    entries = []
+    with os.scandir(OCR_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".txt.gz"):
+                info = entry.stat()
+                entries.append((info.st_mtime, info.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= OCR_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def _disk_cache_put(key, text):
+    """Tulis atomik (tmp lalu rename) lalu pangkas cache ke OCR_CACHE_MAX_BYTES.
+    Cache disk hanya optimasi, jadi kegagalan I/O diabaikan."""
+    path = _disk_cache_path(key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+        _disk_cache_prune()
+    except OSError:
+        log.warning("Gagal menyimpan cache OCR ke %s", OCR_CACHE_DIR, exc_info=True)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+# Streamlit menjalankan ulang script tiap interaksi; cache agar PDF yang sama tidak di-OCR ulang.
+# Kunci cache cukup hash file: argumen berawalan "_" tidak di-hash oleh Streamlit, dan isi
+# file baru disalin jadi bytes saat cache miss. Hasil yang butuh OCR juga disimpan di
+# cache disk berukuran terbatas supaya tetap ada setelah app restart.
+@st.cache_data(show_spinner=False, max_entries=32)
+def read_pdf_fast(file_hash, _pdf_file, ocr_lang="ind", max_pages=1, dpi=OCR_DPI):
+    """Baca text layer PDF; hanya halaman yang teksnya (hampir) kosong yang di-OCR."""
+    page_texts, kosong = pdf_page_texts(file_hash, _pdf_file, max_pages)
+    pages_needing_ocr = halaman_perlu_ocr(page_texts, kosong)
+    if pages_needing_ocr:
+        key = f"v{OCR_CACHE_VERSI}-{file_hash}-{ocr_lang}-{max_pages}-{dpi}"
+        text = _disk_cache_get(key)
+        if text is not None:
+            return text
+        file_bytes = _pdf_file.getvalue()
+        # Tesseract bekerja di luar GIL, jadi tiap halaman bisa di-OCR bersamaan
+        hasil = _ocr_executor().map(lambda i: _ocr_pdf_page(file_bytes, i + 1, ocr_lang, dpi), pages_needing_ocr)
+        for i, txt in zip(pages_needing_ocr, hasil):
+            # Text layer yang ada tetap dipakai jika OCR tidak menghasilkan yang lebih baik
+            if _jumlah_alnum(txt) > _jumlah_alnum(page_texts[i]):
+                page_texts[i] = txt
+        text = clean_text("\n".join(page_texts))
+        _disk_cache_put(key, text)
+        return text
+
+    return clean_text("\n".join(page_texts))
+
+BULAN_PATTERN = r"(?:Januari|Februari|Maret|April|Mei|Juni|Juli|Agustus|September|Oktober|November|Desember)"
+
+# Pola per field; nilai yang diambil selalu ada di grup (?P<val>...).
+# Panjang nilai dan jeda dibatasi supaya teks OCR yang berantakan tidak
+# membuat match melebar (nomor <= 80 karakter, nominal <= 30 karakter).
+POLA_NOMOR = r"(?i:(?:Nomor|No)\s{0,10}[:\-]?\s{0,10}(?P<val>[A-Za-z0-9\/\.\-]{1,80}))"
+POLA_TANGGAL = r"(?i:(?P<val>\d{1,2}\s{1,5}" + BULAN_PATTERN + r"\s{1,5}\d{4}))"
+POLA_DURASI = r"(?i:(?P<val>\d{1,3})\s{0,10}hari\s{0,10}kalender)"
+POLA_RP = r"Rp\s{0,10}(?P<val>[\d\.\,]{1,30})"
+POLA_DPP = r"DPP\s{0,10}Rp\s{0,10}(?P<val>[\d\.\,]{1,30})"
+POLA_PPN = r"PPN\s{0,10}Rp\s{0,10}(?P<val>[\d\.\,]{1,30})"
+
+def gabung_pola(pola):
+    """Gabungkan pola beberapa field jadi satu regex alternation dengan grup bernama."""
+    bagian = [
+        f"(?P<{nama}>{p.replace('(?P<val>', f'(?P<{nama}_val>')})"
+        for nama, p in pola.items()
+    ]
+    return re.compile("|".join(bagian))
 
-def extract_tanggal_kontrak(text):
-    match = re.search(r"(\d{1,2}\s+(?:Januari|Februari|Maret|April|Mei|Juni|Juli|Agustus|September|Oktober|November|Desember)\s+\d{4})", text, re.IGNORECASE)
-    return match.group(1) if match else None
+# Dikompilasi sekali saat modul dimuat; tiap dokumen cukup di-scan satu kali
+TANGGAL_RE = re.compile(POLA_TANGGAL)
+KONTRAK_POLA = {
+    "nomor_kontrak": POLA_NOMOR,
+    "tanggal_mulai_raw": POLA_TANGGAL,
+    "duration_days": POLA_DURASI,
+    "nilai_kontrak": POLA_RP,
+}
+INVOICE_POLA = {
+    "tanggal": POLA_TANGGAL,
+    "dpp": POLA_DPP,
+    "ppn": POLA_PPN,
+    "total": POLA_RP,
+}
+# Urutan field hasil ikut dict di atas, bukan groupindex (re2 mengurutkannya per nama)
+KONTRAK_FIELDS, KONTRAK_RE = tuple(KONTRAK_POLA), gabung_pola(KONTRAK_POLA)
+INVOICE_FIELDS, INVOICE_RE = tuple(INVOICE_POLA), gabung_pola(INVOICE_POLA)
 
-def extract_durasi(text):
-    match = re.search(r"(\d{1,3})\s*hari\s*kalender", text, re.IGNORECASE)
-    return int(match.group(1)) if match else None
+def scan_fields(pola, fields, text, juga_isi=None, seed=None):
+    """Ambil kemunculan pertama tiap field (urutan `fields`) dalam satu kali scan.
 
-def extract_nilai_kontrak(text):
-    match = re.search(r"Rp\s*([\d\.\,]+)", text)
-    return match.group(1) if match else None
+    `juga_isi` memetakan field ke field lain yang ikut diisi dari nilai yang
+    sama, misalnya Rp di dalam "DPP Rp ..." juga kandidat total invoice.
+    `seed` berisi hasil scan sebelumnya; hanya field yang masih kosong dicari,
+    dan scan berhenti begitu semua field terisi.
+    """
+    juga_isi = juga_isi or {}
+    seed = seed or {}
+    hasil = {nama: seed.get(nama) for nama in fields}
+    kosong = sum(v is None for v in hasil.values())
+    for m in pola.finditer(text):
+        if not kosong:
+            break
+        nama = m.lastgroup
+        nilai = m.group(nama + "_val")
+        for field in (nama, juga_isi.get(nama)):
+            if field and hasil[field] is None:
+                hasil[field] = nilai
+                kosong -= 1
+    return hasil
+
+def extract_kontrak_data(text, seed=None):
+    data = scan_fields(KONTRAK_RE, KONTRAK_FIELDS, text, seed=seed)
+    if isinstance(data["duration_days"], str):
+        data["duration_days"] = int(data["duration_days"])
+    return data
 
 def extract_tanggal_ba(text):
-    match = re.search(r"(\d{1,2}\s+(?:Januari|Februari|Maret|April|Mei|Juni|Juli|Agustus|September|Oktober|November|Desember)\s+\d{4})", text, re.IGNORECASE)
-    return match.group(1) if match else None
+    match = TANGGAL_RE.search(text)
+    return match.group("val") if match else None
 
 def extract_invoice_data(text):
-    tgl = extract_tanggal_ba(text)
-    dpp = re.search(r"DPP\s*Rp\s*([\d\.\,]+)", text)
-    ppn = re.search(r"PPN\s*Rp\s*([\d\.\,]+)", text)
-    total = re.search(r"Rp\s*([\d\.\,]+)", text)
-    return {
-        "tanggal": tgl,
-        "dpp": dpp.group(1) if dpp else None,
-        "ppn": ppn.group(1) if ppn else None,
-        "total": total.group(1) if total else None
-    }
+    return scan_fields(INVOICE_RE, INVOICE_FIELDS, text, juga_isi={"dpp": "total", "ppn": "total"})
 
-# ============== STREAMLIT APP =================
+# Tabel translate: hapus semua karakter ASCII selain digit, koma, dan titik dalam satu pass C
+_AMOUNT_DELETE = str.maketrans("", "", "".join(chr(c) for c in range(128) if chr(c) not in "0123456789,."))
 
-st.title("📑 Three Way Matching - Hutang Usaha")
+def normalize_amount(s):
+    """Ubah teks nominal ("Rp 1.234.567,89" / "1,234,567.89") jadi float; None jika tidak valid."""
+    if not s:
+        return None
+    s = s.translate(_AMOUNT_DELETE).strip(",.")
+    if "," in s and "." in s:
+        # Pemisah yang muncul terakhir adalah desimal
+        desimal = "," if s.rfind(",") > s.rfind(".") else "."
+        ribuan = "." if desimal == "," else ","
+        s = s.replace(ribuan, "").replace(desimal, ".")
+    elif "," in s or "." in s:
+        sep = "," if "," in s else "."
+        bagian = s.split(sep)
+        # Satu pemisah yang tidak diikuti tepat 3 digit dianggap desimal
+        if len(bagian) == 2 and len(bagian[1]) != 3:
+            s = bagian[0] + "." + bagian[1]
+        else:
+            s = "".join(bagian)
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+@st.cache_resource
+def _date_parser():
+    """Satu DateDataParser per proses (script Streamlit dieksekusi ulang tiap rerun,
+    jadi objek level-modul ikut dibuat ulang). Data locale id/en dimuat di sini
+    lewat satu parse pemanasan, bukan saat tanggal dokumen pertama di-parse."""
+    from dateparser.date import DateDataParser
 
-# Step 1: Upload Kontrak
-st.header("1️⃣ Upload Kontrak")
-kontrak_file = st.file_uploader("Upload file kontrak (PDF)", type=["pdf"])
-kontrak_data = {}
+    parser = DateDataParser(languages=["id", "en"])
+    parser.get_date_data("1 Januari 2020")
+    return parser
 
-if kontrak_file:
-    kontrak_text = read_pdf_fast(kontrak_file.read())
-    kontrak_data["nomor_kontrak"] = extract_nomor_kontrak(kontrak_text)
-    kontrak_data["tanggal_mulai_raw"] = extract_tanggal_kontrak(kontrak_text)
-    kontrak_data["duration_days"] = extract_durasi(kontrak_text)
-    kontrak_data["nilai_kontrak"] = extract_nilai_kontrak(kontrak_text)
+# Nama bulan Indonesia/Inggris (lengkap dan singkatan) untuk format "dd Bulan yyyy",
+# satu-satunya bentuk yang dihasilkan POLA_TANGGAL maupun strftime("%d %B %Y")
+BULAN = {
+    "januari": 1, "january": 1, "jan": 1,
+    "februari": 2, "february": 2, "feb": 2, "pebruari": 2, "peb": 2,
+    "maret": 3, "march": 3, "mar": 3,
+    "april": 4, "apr": 4,
+    "mei": 5, "may": 5,
+    "juni": 6, "june": 6, "jun": 6,
+    "juli": 7, "july": 7, "jul": 7,
+    "agustus": 8, "august": 8, "agu": 8, "agt": 8, "aug": 8,
+    "september": 9, "sep": 9, "sept": 9,
+    "oktober": 10, "october": 10, "okt": 10, "oct": 10,
+    "november": 11, "nopember": 11, "nov": 11, "nop": 11,
+    "desember": 12, "december": 12, "des": 12, "dec": 12,
+}
+TANGGAL_SEDERHANA_RE = re.compile(r"(\d{1,2})\s+([a-z]+)\.?\s+(\d{4})")
+
+def _parse_tanggal(text):
+    m = TANGGAL_SEDERHANA_RE.fullmatch(text)
+    if m and m.group(2) in BULAN:
+        try:
+            return datetime(int(m.group(3)), BULAN[m.group(2)], int(m.group(1)))
+        except ValueError:
+            pass  # mis. "31 februari 2024"; serahkan ke dateparser
+    return _date_parser().get_date_data(text).date_obj
+
+@st.cache_resource
+def _parse_tanggal_cached():
+    """Memo parse tanggal dibuat sekali per proses: lru_cache level-modul ikut
+    dibuat ulang setiap rerun karena script Streamlit dieksekusi ulang."""
+    return lru_cache(maxsize=4096)(_parse_tanggal)
+
+def parse_tanggal(text):
+    """Parse string tanggal. Format "dd Bulan yyyy" di-parse langsung lewat tabel
+    bulan; bentuk lain diserahkan ke dateparser (mahal, jadi di-cache per string)."""
+    if not text or not text.strip():
+        return None
+    return _parse_tanggal_cached()(text.strip().lower())
+
+# Hasil per dokumen (teks + field) di-cache per hash file, jadi rerun karena
+# interaksi widget tidak menjalankan ulang regex maupun parsing tanggal.
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def proses_kontrak(file_hash, _pdf_file):
+    text = read_pdf_fast(file_hash, _pdf_file, dpi=OCR_QUICK_DPI)
+    data = extract_kontrak_data(text)
+    # nomor_kontrak tidak dipakai sebagai penanda: POLA_NOMOR juga cocok dengan "no"
+    # di tengah kata OCR ("nominal", "ekonomi"), jadi hampir selalu terisi
+    if ((not data["tanggal_mulai_raw"] or not data["nilai_kontrak"])
+            and halaman_perlu_ocr(*pdf_page_texts(file_hash, _pdf_file))):
+        # Pass cepat (gambar lebih kecil) tidak cukup; ulangi OCR dengan resolusi normal.
+        # PDF tanpa halaman scan tidak diulang karena DPI tidak mengubah text layer.
+        text = read_pdf_fast(file_hash, _pdf_file, dpi=OCR_DPI)
+        data = extract_kontrak_data(text, seed=data)
 
     # Hitung tanggal selesai jika ada durasi
-    if kontrak_data["tanggal_mulai_raw"] and kontrak_data["duration_days"]:
-        mulai = dateparser.parse(kontrak_data["tanggal_mulai_raw"])
-        selesai = mulai + timedelta(days=kontrak_data["duration_days"])
-        kontrak_data["tanggal_selesai_raw"] = selesai.strftime("%d %B %Y")
+    if data["tanggal_mulai_raw"] and data["duration_days"]:
+        mulai = parse_tanggal(data["tanggal_mulai_raw"])
+        selesai = mulai + timedelta(days=data["duration_days"])
+        data["tanggal_selesai_raw"] = selesai.strftime("%d %B %Y")
     else:
-        kontrak_data["tanggal_selesai_raw"] = None
-
-    st.json(kontrak_data)
-
-# Step 2: Upload BA
-st.header("2️⃣ Upload Berita Acara (BA)")
-ba_file = st.file_uploader("Upload file BA (PDF)", type=["pdf"])
-ba_tanggal = None
-if ba_file:
-    ba_text = read_pdf_fast(ba_file.read())
-    ba_tanggal_raw = extract_tanggal_ba(ba_text)
-    ba_tanggal = dateparser.parse(ba_tanggal_raw) if ba_tanggal_raw else None
-    st.write(f"Tanggal BA: {ba_tanggal_raw or 'Tidak ditemukan'}")
-
-# Step 3: Upload Invoice
-st.header("3️⃣ Upload Invoice")
-inv_file = st.file_uploader("Upload file Invoice (PDF)", type=["pdf"])
-invoice_data = {}
-if inv_file:
-    inv_text = read_pdf_fast(inv_file.read())
-    invoice_data = extract_invoice_data(inv_text)
-    invoice_data["tanggal_parsed"] = dateparser.parse(invoice_data["tanggal"]) if invoice_data["tanggal"] else None
-    st.json(invoice_data)
+        data["tanggal_selesai_raw"] = None
+    return data
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def proses_ba(file_hash, _pdf_file):
+    return extract_tanggal_ba(read_pdf_fast(file_hash, _pdf_file))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def proses_invoice(file_hash, _pdf_file):
+    data = extract_invoice_data(read_pdf_fast(file_hash, _pdf_file))
+    data["tanggal_parsed"] = parse_tanggal(data["tanggal"])
+    return data
+
+def proses_di_latar(pool, fn, uploaded_file):
+    """Jalankan proses_* di thread latar supaya kontrak, BA, dan invoice yang diupload
+    bersamaan diproses paralel; OCR-nya tetap dibatasi oleh _ocr_executor."""
+    file_hash = hash_upload(uploaded_file)  # session_state hanya di thread script
+    ctx = get_script_run_ctx()
+
+    def tugas():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(file_hash, uploaded_file)
+
+    return pool.submit(tugas)
+
+# ============== STREAMLIT APP =================
+
+st.title("📑 Three Way Matching - Hutang Usaha")
+
+# Pool per run script: dokumen satu sesi tidak mengantre di belakang sesi lain, dan
+# thread-nya (beserta konteks sesi yang ditempel) selesai bersama run ini. Pool terpisah
+# dari _ocr_executor karena tugas dokumen menunggu tugas OCR.
+with ThreadPoolExecutor(max_workers=3, thread_name_prefix="dokumen") as dokumen_pool:
+    # Step 1: Upload Kontrak
+    st.header("1️⃣ Upload Kontrak")
+    kontrak_file = st.file_uploader("Upload file kontrak (PDF)", type=["pdf"])
+    kontrak_slot = st.container()
+    kontrak_job = proses_di_latar(dokumen_pool, proses_kontrak, kontrak_file) if kontrak_file else None
+
+    # Step 2: Upload BA
+    st.header("2️⃣ Upload Berita Acara (BA)")
+    ba_file = st.file_uploader("Upload file BA (PDF)", type=["pdf"])
+    ba_slot = st.container()
+    ba_job = proses_di_latar(dokumen_pool, proses_ba, ba_file) if ba_file else None
+
+    # Step 3: Upload Invoice
+    st.header("3️⃣ Upload Invoice")
+    inv_file = st.file_uploader("Upload file Invoice (PDF)", type=["pdf"])
+    inv_slot = st.container()
+    inv_job = proses_di_latar(dokumen_pool, proses_invoice, inv_file) if inv_file else None
+
+    # Ketiga dokumen sudah berjalan paralel; tampilkan hasil sesuai urutan langkah
+    kontrak_data = {}
+    if kontrak_job:
+        kontrak_data = kontrak_job.result()
+        kontrak_slot.json(kontrak_data)
+
+    ba_tanggal = None
+    if ba_job:
+        ba_tanggal_raw = ba_job.result()
+        ba_tanggal = parse_tanggal(ba_tanggal_raw)
+        ba_slot.write(f"Tanggal BA: {ba_tanggal_raw or 'Tidak ditemukan'}")
+
+    invoice_data = {}
+    if inv_job:
+        invoice_data = inv_job.result()
+        inv_slot.json(invoice_data)
 
 # Step 4: Three Way Matching
 st.header("📊 Hasil Matching")
@@ -110,8 +684,8 @@ if kontrak_data and ba_tanggal and invoice_data:
     hasil = {}
 
     # Match BA vs Kontrak (tanggal)
-    k_mulai = dateparser.parse(kontrak_data.get("tanggal_mulai_raw")) if kontrak_data.get("tanggal_mulai_raw") else None
-    k_selesai = dateparser.parse(kontrak_data.get("tanggal_selesai_raw")) if kontrak_data.get("tanggal_selesai_raw") else None
+    k_mulai = parse_tanggal(kontrak_data.get("tanggal_mulai_raw"))
+    k_selesai = parse_tanggal(kontrak_data.get("tanggal_selesai_raw"))
     if k_mulai and k_selesai:
         hasil["BA_vs_Kontrak"] = "MATCH" if k_mulai <= ba_tanggal <= k_selesai else "NOT MATCH"
     else:
@@ -125,8 +699,10 @@ if kontrak_data and ba_tanggal and invoice_data:
         hasil["Invoice_vs_BA"] = "DATA TIDAK LENGKAP"
 
     # Match Nilai Invoice vs Kontrak
-    if kontrak_data.get("nilai_kontrak") and invoice_data.get("total"):
-        hasil["Nilai_Invoice_vs_Kontrak"] = "MATCH" if kontrak_data["nilai_kontrak"] == invoice_data["total"] else "NOT MATCH"
+    nilai_kontrak = normalize_amount(kontrak_data.get("nilai_kontrak"))
+    nilai_invoice = normalize_amount(invoice_data.get("total"))
+    if nilai_kontrak is not None and nilai_invoice is not None:
+        hasil["Nilai_Invoice_vs_Kontrak"] = "MATCH" if abs(nilai_kontrak - nilai_invoice) < 0.01 else "NOT MATCH"
     else:
         hasil["Nilai_Invoice_vs_Kontrak"] = "DATA TIDAK LENGKAP"
 